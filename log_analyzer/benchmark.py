@@ -0,0 +1,161 @@
+import argparse
+import inspect
+import itertools
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from detectors import DETECTORS, create_detector
+from pattern_matcher import predict_anomalies, train_pipeline
+
+# Templates of the normal log messages and their relative frequency
+NORMAL_TEMPLATES = [
+    ('[DEBUG] - XmlConfiguration is now operational', 20),
+    ('[DEBUG] - Attempting to create directory "C:\\ProgramData\\chocolatey\\lib\\package{0}".', 15),
+    ('[INFO ] - Downloading package{0} {1}.{2}.{3}... {4}% complete', 30),
+    ('[DEBUG] - Running command with {0} arguments in {1} ms', 15),
+    ('[INFO ] - {0} validations performed. {0} success(es), 0 warning(s), and 0 error(s).', 10),
+    ('[DEBUG] - Backing up existing package{0} prior to operation.', 10),
+    ('[DEBUG] - Attempting to delete file "C:\\ProgramData\\chocolatey\\lib\\{name}\\tools\\{file}".', 15),
+    ('[INFO ] - {name} v{1}.{2} already installed. Use --force to reinstall.', 10),
+    ('[DEBUG] - Moving \'C:\\Users\\{user}\\AppData\\Local\\Temp\\{name}\\{file}\' to \'C:\\ProgramData\\{name}\\{file}\'', 10),
+]
+
+# Values of the named parameters of the templates
+NAMES = ['git', 'nodejs', 'python3', 'vscode', '7zip', 'googlechrome', 'dotnetfx', 'vcredist140', 'notepadplusplus']
+FILES = ['chocolateyInstall.ps1', 'chocolateyUninstall.ps1', 'setup.exe', 'package.nupkg', 'LICENSE.txt', 'VERIFICATION.txt']
+USERS = ['Administrator', 'build', 'jsmith', 'svc-deploy']
+
+# Log messages that only show up when something goes wrong
+ANOMALY_TEMPLATES = [
+    '[ERROR] - Access to the path "C:\\ProgramData\\chocolatey\\lib-bad\\package{0}" is denied.',
+    '[ERROR] - Unable to resolve dependency chain, checksum mismatch for package{0}',
+    '[WARN ] - Service crashed unexpectedly with exit code {0}, restarting',
+    '[FATAL] - Out of memory while extracting archive of {0} MB',
+    '[ERROR] - The remote server returned an error: (503) Server Unavailable.',
+]
+
+# Backend options benchmarked by default, every backend is run with each combination of the options it takes
+DEFAULT_SWEEP = {
+    'contamination': [0.001, 0.01, 0.05],
+    'max_ratio': [0.0005, 0.001, 0.005, 0.02],
+}
+
+
+def generate_synthetic_log(n_lines, anomaly_ratio=0.002, seed=0):
+    """
+    Generate a labelled synthetic log in the format of the Chocolatey logs.
+
+    Args:
+        n_lines (int): The number of log messages.
+        anomaly_ratio (float): The share of anomalous log messages.
+        seed (int): The seed of the random number generator.
+
+    Returns:
+        tuple: The list of log messages and the list of labels, True for anomalies.
+    """
+    rng = random.Random(seed)
+    templates, weights = zip(*NORMAL_TEMPLATES)
+    timestamp = datetime(2021, 10, 16)
+
+    messages = []
+    labels = []
+    for _ in range(n_lines):
+        timestamp += timedelta(milliseconds=rng.randint(1, 500))
+        is_anomaly = rng.random() < anomaly_ratio
+        template = rng.choice(ANOMALY_TEMPLATES) if is_anomaly else rng.choices(templates, weights)[0]
+        params = [rng.randint(0, 9999) for _ in range(5)]
+        pid = rng.randint(1000, 9999)
+        message = template.format(*params, name=rng.choice(NAMES), file=rng.choice(FILES), user=rng.choice(USERS))
+        messages.append(f"{timestamp.strftime('%Y-%m-%d %H:%M:%S')},{timestamp.microsecond // 1000:03d} {pid} {message}\n")
+        labels.append(is_anomaly)
+
+    return messages, labels
+
+
+def benchmark_detector(name, messages, labels, options=None):
+    """
+    Fit a detector on a labelled log and measure its throughput and accuracy.
+
+    Args:
+        name (str): The name of the detector backend.
+        messages (list): The log messages.
+        labels (list): The labels of the log messages, True for anomalies.
+        options (dict): Options passed to the backend.
+
+    Returns:
+        dict: The lines per second for fitting and scoring together, the precision and the recall.
+    """
+    start = time.perf_counter()
+    pipeline = train_pipeline(create_detector(name, **(options or {})), messages)
+    if not pipeline:
+        return None
+    is_anomaly = predict_anomalies(pipeline, messages)
+    elapsed = time.perf_counter() - start
+
+    true_positives = sum(1 for predicted, label in zip(is_anomaly, labels) if predicted and label)
+    n_predicted = int(sum(is_anomaly))
+    n_labelled = sum(labels)
+
+    return {
+        'lines_per_s': len(messages) / elapsed,
+        'precision': true_positives / n_predicted if n_predicted else 0.0,
+        'recall': true_positives / n_labelled if n_labelled else 0.0,
+    }
+
+
+def option_grid(name, sweep):
+    """
+    List the combinations of swept options a detector backend takes.
+
+    Args:
+        name (str): The name of the detector backend.
+        sweep (dict): Lists of option values by option name.
+
+    Returns:
+        list: One dict of options per combination.
+    """
+    parameters = inspect.signature(DETECTORS[name]).parameters
+    names = [option for option in sweep if option in parameters]
+    return [dict(zip(names, values)) for values in itertools.product(*(sweep[option] for option in names))]
+
+
+def parse_option(value):
+    # Parse 'name=value[,value...]' into the option name and its list of values
+    option, _, values = value.partition('=')
+    if not option or not values:
+        raise argparse.ArgumentTypeError(f"invalid option '{value}', expected name=value[,value...]")
+    return option, [json.loads(v) for v in values.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the cost and quality of the anomaly detector backends.')
+    parser.add_argument('--lines', type=int, default=100000, help='number of synthetic log messages')
+    parser.add_argument('--anomaly-ratio', type=float, default=0.002, help='share of anomalous log messages')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic log')
+    parser.add_argument('--detector', action='append', choices=list(DETECTORS),
+                        help='detector to benchmark, may be repeated (default: all)')
+    parser.add_argument('--option', action='append', type=parse_option, metavar='NAME=VALUE[,VALUE...]',
+                        help='backend option values to sweep, may be repeated (default: ' +
+                             ' '.join(f"{option}={','.join(map(str, values))}" for option, values in DEFAULT_SWEEP.items()) + ')')
+    args = parser.parse_args()
+
+    sweep = dict(args.option) if args.option else DEFAULT_SWEEP
+    messages, labels = generate_synthetic_log(args.lines, args.anomaly_ratio, args.seed)
+    print(f'{len(messages)} messages, {sum(labels)} anomalies')
+    print(f"{'detector':<20}{'options':<28}{'lines/s':>12}{'precision':>12}{'recall':>12}")
+
+    for name in args.detector or DETECTORS:
+        for options in option_grid(name, sweep):
+            description = ' '.join(f'{option}={value}' for option, value in options.items())
+            result = benchmark_detector(name, messages, labels, options)
+            if result is None:
+                print(f'{name:<20}{description:<28}{"failed":>12}')
+                continue
+            print(f"{name:<20}{description:<28}{result['lines_per_s']:>12.0f}"
+                  f"{result['precision']:>12.3f}{result['recall']:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
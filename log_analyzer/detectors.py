@@ -0,0 +1,264 @@
+import json
+from abc import ABC, abstractmethod
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.neighbors import NearestNeighbors
+
+from pattern_matcher import create_pipeline
+from encoded_log import EncodedLog, message_template
+
+
+class Detector(ABC):
+    """
+    Interface of an anomaly detector backend.
+
+    A detector is fitted on the log messages of a file and then scores them, the same
+    way as the pipeline returned by create_pipeline(), so it can be passed to
+    train_pipeline() and predict_anomalies() in its place.
+    """
+
+    # Whether the detector works from the templates of an EncodedLog rather than the text of the messages
+    encoded_input = False
+
+    @abstractmethod
+    def fit(self, messages):
+        """
+        Fit the detector on log messages.
+
+        Args:
+            messages (list): The log messages.
+
+        Returns:
+            Detector: The fitted detector.
+        """
+
+    @abstractmethod
+    def decision_function(self, messages):
+        """
+        Score log messages.
+
+        Args:
+            messages (list): The log messages to score.
+
+        Returns:
+            ndarray: One score per message. Negative scores are anomalies.
+        """
+
+
+def _template_index(messages):
+    """
+    Find the distinct templates of log messages.
+
+    An EncodedLog already holds the template id of every message, so its templates are
+    looked up once per distinct id. Other messages are split with message_template().
+
+    Args:
+        messages (sequence): The log messages, or an EncodedLog.
+
+    Returns:
+        tuple: The list of distinct templates and an array giving the index of the
+        template of every message in that list.
+    """
+    if isinstance(messages, EncodedLog):
+        template_ids = np.frombuffer(messages.template_ids, dtype=np.dtype(messages.template_ids.typecode))
+        unique_ids, inverse = np.unique(template_ids, return_inverse=True)
+        return [messages.template(template_id) for template_id in unique_ids], inverse
+
+    index = {}
+    inverse = [index.setdefault(message_template(message), len(index)) for message in messages]
+    return list(index), np.array(inverse, dtype=np.intp)
+
+
+class TemplateDetector(Detector):
+    """
+    Base of the detectors that score log messages by their template alone.
+
+    Subclasses fit on the distinct templates and their counts and score distinct
+    templates, so every message costs a single array lookup once its template is known.
+    """
+
+    encoded_input = True
+
+    def __init__(self):
+        self.n_messages = 0
+
+    def fit(self, messages):
+        if not len(messages):
+            raise ValueError('empty list of messages')
+
+        templates, inverse = _template_index(messages)
+        self.n_messages = len(messages)
+        self.fit_templates(templates, np.bincount(inverse, minlength=len(templates)))
+        return self
+
+    def decision_function(self, messages):
+        if not len(messages):
+            return np.empty(0)
+
+        templates, inverse = _template_index(messages)
+        return np.asarray(self.score_templates(templates), dtype=float)[inverse]
+
+    @abstractmethod
+    def fit_templates(self, templates, counts):
+        """
+        Fit the detector on the distinct templates of the log messages.
+
+        Args:
+            templates (list): The distinct templates.
+            counts (ndarray): The number of messages of every template.
+        """
+
+    @abstractmethod
+    def score_templates(self, templates):
+        """
+        Score distinct templates.
+
+        Args:
+            templates (list): The distinct templates.
+
+        Returns:
+            ndarray: One score per template. Negative scores are anomalies.
+        """
+
+
+class RarityDetector(TemplateDetector):
+    """
+    Flag log messages whose template is rare in the file.
+
+    Args:
+        max_ratio (float): Templates making up less than this share of the messages are anomalies.
+    """
+
+    def __init__(self, max_ratio=0.001):
+        super().__init__()
+        self.max_ratio = max_ratio
+        self.template_counts = {}
+
+    def fit_templates(self, templates, counts):
+        self.template_counts = dict(zip(templates, counts.tolist()))
+
+    def score_templates(self, templates):
+        min_count = self.max_ratio * self.n_messages
+        counts = np.array([self.template_counts.get(template, 0) for template in templates], dtype=float)
+        return (counts - min_count) / self.n_messages
+
+
+class NearestNeighborDetector(TemplateDetector):
+    """
+    Flag log messages with few messages of a similar template in the file.
+
+    Templates are embedded with TF-IDF and a template is scored by the number of
+    messages whose template lies within a cosine distance of radius of it. A rare
+    template that looks like frequent ones is therefore not an anomaly. The messages
+    of the template itself always count, so a template without words, e.g. a blank
+    line or '}', is scored by its own frequency.
+
+    Args:
+        max_ratio (float): Templates with less than this share of the messages in their neighbourhood are anomalies.
+        radius (float): The cosine distance within which two templates are neighbours.
+    """
+
+    def __init__(self, max_ratio=0.001, radius=0.2):
+        super().__init__()
+        self.max_ratio = max_ratio
+        self.radius = radius
+        self.vectorizer = None
+        self.index = None
+        self.counts = None
+        self.template_index = {}
+
+    def fit_templates(self, templates, counts):
+        self.vectorizer = TfidfVectorizer(min_df=1)
+        self.index = NearestNeighbors(radius=self.radius, metric='cosine')
+        self.index.fit(self.vectorizer.fit_transform(templates))
+        self.counts = counts
+        self.template_index = {template: i for i, template in enumerate(templates)}
+
+    def score_templates(self, templates):
+        neighbourhoods = self.index.radius_neighbors(self.vectorizer.transform(templates), return_distance=False)
+        min_count = self.max_ratio * self.n_messages
+        scores = []
+        for template, neighbours in zip(templates, neighbourhoods):
+            count = self.counts[neighbours].sum()
+
+            # A template without words has an all-zero vector, which is not within any distance of itself
+            own = self.template_index.get(template)
+            if own is not None and own not in neighbours:
+                count += self.counts[own]
+
+            scores.append((count - min_count) / self.n_messages)
+        return np.array(scores)
+
+
+class IsolationForestDetector(Detector):
+    """
+    Flag log messages that an isolation forest separates from the others quickly.
+
+    The messages are embedded with TF-IDF and reduced with TruncatedSVD, see create_pipeline().
+
+    Args:
+        contamination (float): The expected share of anomalies in the file.
+    """
+
+    def __init__(self, contamination=0.01):
+        self.contamination = contamination
+        self.pipeline = create_pipeline(contamination=contamination)
+
+    def fit(self, messages):
+        self.pipeline.fit(messages)
+        return self
+
+    def decision_function(self, messages):
+        return self.pipeline.decision_function(messages)
+
+
+# Available detector backends by name
+DETECTORS = {
+    'isolation_forest': IsolationForestDetector,
+    'rarity': RarityDetector,
+    'nearest_neighbor': NearestNeighborDetector,
+}
+
+DEFAULT_DETECTOR = 'isolation_forest'
+
+
+def create_detector(name=DEFAULT_DETECTOR, **kwargs):
+    """
+    Create an anomaly detector backend.
+
+    Args:
+        name (str): The name of the backend, one of DETECTORS.
+        **kwargs: Options passed to the backend.
+
+    Returns:
+        Detector: The unfitted detector.
+    """
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown detector '{name}', expected one of {', '.join(DETECTORS)}")
+    return DETECTORS[name](**kwargs)
+
+
+def load_family_detectors(filename):
+    """
+    Load the detector backend to use per log family from a JSON file.
+
+    The file maps base filenames to a detector name and its options, e.g.
+    {"choco": {"detector": "rarity", "options": {"max_ratio": 0.005}}}.
+
+    Args:
+        filename (str): The name of the JSON file.
+
+    Returns:
+        dict: (name, options) tuples by base filename.
+    """
+    with open(filename, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    family_detectors = {}
+    for family, entry in config.items():
+        name = entry.get('detector', DEFAULT_DETECTOR)
+        if name not in DETECTORS:
+            raise ValueError(f"Unknown detector '{name}' for '{family}', expected one of {', '.join(DETECTORS)}")
+        family_detectors[family] = (name, entry.get('options', {}))
+    return family_detectors
@@ -0,0 +1,430 @@
+import json
+import re
+import sys
+from array import array
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from templates import WILDCARD, split_template
+
+# Timestamp that starts every log message, e.g. '2021-10-16 01:03:40,045 '
+_TIMESTAMP_PATTERN = re.compile(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),(\d{3}) ')
+_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+_EPOCH = datetime(1970, 1, 1)
+
+# Timestamp of log messages that do not start with one
+NO_TIMESTAMP = -1
+
+# Stored timestamp offsets of log messages without a timestamp and with one kept in large_timestamps
+_NO_OFFSET = -2 ** 31
+_LARGE_OFFSET = -2 ** 31 + 1
+
+
+@lru_cache(maxsize=4096)
+def _parse_seconds(text):
+    # Log messages come many to a second, so every second is only parsed once
+    try:
+        timestamp = datetime(int(text[0:4]), int(text[5:7]), int(text[8:10]),
+                             int(text[11:13]), int(text[14:16]), int(text[17:19]))
+        return (timestamp - _EPOCH) // timedelta(milliseconds=1)
+    except ValueError:
+        return NO_TIMESTAMP
+
+
+def _match_timestamp(match):
+    if not match:
+        return NO_TIMESTAMP
+    seconds = _parse_seconds(match.group(1))
+    if seconds == NO_TIMESTAMP:
+        return NO_TIMESTAMP
+    return seconds + int(match.group(2))
+
+
+def parse_timestamp(message):
+    """
+    Parse the timestamp at the start of a log message.
+
+    Args:
+        message (str): The log message.
+
+    Returns:
+        int: The timestamp in milliseconds since the epoch, or NO_TIMESTAMP.
+    """
+    return _match_timestamp(_TIMESTAMP_PATTERN.match(message))
+
+
+def format_timestamp(timestamp):
+    """
+    Format a timestamp the way it starts a log message.
+
+    Args:
+        timestamp (int): The timestamp in milliseconds since the epoch.
+
+    Returns:
+        str: The formatted timestamp, e.g. '2021-10-16 01:03:40,045'.
+    """
+    seconds, millisecond = divmod(timestamp, 1000)
+    return f'{(_EPOCH + timedelta(seconds=seconds)).strftime(_TIMESTAMP_FORMAT)},{millisecond:03d}'
+
+
+def _split_message(message):
+    # Split off the timestamp, then split the rest of the message into its template and parameters
+    match = _TIMESTAMP_PATTERN.match(message)
+    timestamp = _match_timestamp(match)
+    text = message.rstrip('\n')
+    if timestamp != NO_TIMESTAMP:
+        text = text[match.end():]
+    parts, params = split_template(text)
+    return timestamp, parts, params
+
+
+def message_template(message):
+    """
+    Get the template of a log message the way an EncodedLog keeps it.
+
+    Args:
+        message (str): The log message.
+
+    Returns:
+        str: The template without the timestamp, with every variable part replaced by WILDCARD.
+    """
+    _, parts, _ = _split_message(message)
+    return WILDCARD.join(parts)
+
+
+class PatternRecord:
+    """
+    A log pattern and the number of log messages that matched it.
+
+    Args:
+        count (int): The number of log messages.
+        message (str): The template of the log messages.
+    """
+
+    __slots__ = ('count', 'message')
+
+    def __init__(self, count, message):
+        self.count = count
+        self.message = message
+
+
+class InternTable:
+    """
+    Assign consecutive ids to values and keep every distinct value once.
+
+    Args:
+        intern (callable): Applied to every new value before it is stored.
+        values (list): The values of an existing table, in the order of their ids.
+    """
+
+    __slots__ = ('values', '_ids', '_intern')
+
+    def __init__(self, intern=None, values=None):
+        self.values = [] if values is None else values
+        self._ids = None
+        self._intern = intern
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, value_id):
+        return self.values[value_id]
+
+    def compact(self):
+        # Drop the ids of the values until the next add()
+        self._ids = None
+
+    def add(self, value):
+        # The ids are only indexed while values are being added, see compact()
+        if self._ids is None:
+            self._ids = {value: value_id for value_id, value in enumerate(self.values)}
+        value_id = self._ids.get(value)
+        if value_id is None:
+            if self._intern is not None:
+                value = self._intern(value)
+            value_id = len(self.values)
+            self._ids[value] = value_id
+            self.values.append(value)
+        return value_id
+
+
+def _intern_parts(parts):
+    return tuple(sys.intern(part) for part in parts)
+
+
+def _fit_id(ids, value_id):
+    # Ids are kept as uint16 until one of them needs uint32
+    if value_id > 0xFFFF and ids.typecode == 'H':
+        return array('I', ids)
+    return ids
+
+
+class EncodedLog:
+    """
+    Compact representation of the log messages of a file.
+
+    Every message is stored as a template id, a timestamp and the ids of its variable
+    parameters, ids taking 16 bits until there are more than 65536 of them and 32 bits
+    afterwards, with every distinct template and parameter kept once in an InternTable.
+    Timestamps are kept as a 64-bit base per CHECKPOINT_INTERVAL messages and a 32-bit
+    offset per message, see timestamp().
+    Templates are kept as the tuple of their constant parts, see split_template(), and
+    fix the number of parameters of their messages, so the parameter ids of all messages
+    are stored back to back in params with only the offset of every CHECKPOINT_INTERVAL-th
+    message kept in param_checkpoints. The anomaly score of every message is kept next to
+    it once the log has been scored, so it can be analysed again with a different
+    threshold without the original text.
+
+    An EncodedLog is a sequence of the original log messages, so it can be passed to
+    the pipeline in place of a list of messages. Slicing it gives an EncodedLog sharing
+    the templates and parameter values, so detectors can work from its template ids.
+    """
+
+    __slots__ = ('templates', 'param_values', 'param_counts', 'template_ids', 'timestamp_bases',
+                 'timestamp_offsets', 'large_timestamps', 'params', 'param_checkpoints', 'scores')
+
+    CHECKPOINT_INTERVAL = 64
+
+    def __init__(self, templates=None, param_values=None, param_counts=None):
+        self.templates = InternTable(_intern_parts) if templates is None else templates
+        self.param_values = InternTable() if param_values is None else param_values
+        self.param_counts = array('I') if param_counts is None else param_counts
+        self.template_ids = array('H')
+        self.timestamp_bases = array('q')
+        self.timestamp_offsets = array('i')
+        self.large_timestamps = {}
+        self.params = array('H')
+        self.param_checkpoints = array('Q')
+        self.scores = array('d')
+
+    def __len__(self):
+        return len(self.template_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError('encoded logs can only be sliced with a step of 1')
+            return self._slice(start, max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('log message index out of range')
+        return self.message(index)
+
+    def __iter__(self):
+        offset = 0
+        for i in range(len(self)):
+            yield self._decode(i, offset)
+            offset += self.param_counts[self.template_ids[i]]
+
+    def _slice(self, start, stop):
+        encoded = EncodedLog(self.templates, self.param_values, self.param_counts)
+        first_offset = self.param_offset(start)
+        offset = first_offset
+        for i in range(start, stop):
+            if (i - start) % self.CHECKPOINT_INTERVAL == 0:
+                encoded.param_checkpoints.append(offset - first_offset)
+                encoded.timestamp_bases.append(NO_TIMESTAMP)
+            encoded._append_timestamp(self.timestamp(i))
+            offset += self.param_counts[self.template_ids[i]]
+        encoded.template_ids = self.template_ids[start:stop]
+        encoded.params = self.params[first_offset:offset]
+        encoded.scores = self.scores[start:stop]
+        return encoded
+
+    def append(self, message):
+        """
+        Encode a log message and add it to the log.
+
+        Args:
+            message (str): The log message, terminated by a newline.
+        """
+        timestamp, parts, params = _split_message(message)
+        template_id = self.templates.add(parts)
+        if template_id == len(self.param_counts):
+            self.param_counts.append(len(params))
+
+        if len(self) % self.CHECKPOINT_INTERVAL == 0:
+            self.param_checkpoints.append(len(self.params))
+            self.timestamp_bases.append(NO_TIMESTAMP)
+        self._append_timestamp(timestamp)
+        self.template_ids = _fit_id(self.template_ids, template_id)
+        self.template_ids.append(template_id)
+        param_ids = [self.param_values.add(param) for param in params]
+        if param_ids:
+            self.params = _fit_id(self.params, len(self.param_values) - 1)
+            self.params.extend(param_ids)
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def compact(self):
+        """
+        Release the memory that is only needed to encode more log messages.
+        """
+        self.templates.compact()
+        self.param_values.compact()
+
+        # Copying an array allocates exactly the memory it needs
+        self.template_ids = array(self.template_ids.typecode, self.template_ids)
+        self.timestamp_offsets = array('i', self.timestamp_offsets)
+        self.params = array(self.params.typecode, self.params)
+
+    def _append_timestamp(self, timestamp):
+        # Timestamps are kept relative to the first timestamp of their block of CHECKPOINT_INTERVAL
+        # messages, the few that are too far from it for 32 bits are kept in large_timestamps
+        if timestamp == NO_TIMESTAMP:
+            self.timestamp_offsets.append(_NO_OFFSET)
+            return
+        if self.timestamp_bases[-1] == NO_TIMESTAMP:
+            self.timestamp_bases[-1] = timestamp
+        offset = timestamp - self.timestamp_bases[-1]
+        if not _LARGE_OFFSET < offset < 2 ** 31:
+            self.large_timestamps[len(self.timestamp_offsets)] = timestamp
+            offset = _LARGE_OFFSET
+        self.timestamp_offsets.append(offset)
+
+    def timestamp(self, index):
+        """
+        Get the timestamp of a log message.
+
+        Args:
+            index (int): The index of the log message.
+
+        Returns:
+            int: The timestamp in milliseconds since the epoch, or NO_TIMESTAMP.
+        """
+        offset = self.timestamp_offsets[index]
+        if offset == _NO_OFFSET:
+            return NO_TIMESTAMP
+        if offset == _LARGE_OFFSET:
+            return self.large_timestamps[index]
+        return self.timestamp_bases[index // self.CHECKPOINT_INTERVAL] + offset
+
+    def param_offset(self, index):
+        # Start from the last checkpoint and add the parameter counts of the messages in between
+        checkpoint = index // self.CHECKPOINT_INTERVAL
+        if checkpoint >= len(self.param_checkpoints):
+            return len(self.params)
+        offset = self.param_checkpoints[checkpoint]
+        for i in range(checkpoint * self.CHECKPOINT_INTERVAL, index):
+            offset += self.param_counts[self.template_ids[i]]
+        return offset
+
+    def _decode(self, index, offset):
+        template_id = self.template_ids[index]
+        parts = self.templates[template_id]
+        param_ids = self.params[offset:offset + self.param_counts[template_id]]
+
+        pieces = [parts[0]]
+        for param_id, part in zip(param_ids, parts[1:]):
+            pieces.append(self.param_values[param_id])
+            pieces.append(part)
+        timestamp = self.timestamp(index)
+        if timestamp != NO_TIMESTAMP:
+            pieces.insert(0, format_timestamp(timestamp) + ' ')
+        pieces.append('\n')
+        return ''.join(pieces)
+
+    def message(self, index):
+        """
+        Decode a log message.
+
+        Args:
+            index (int): The index of the log message.
+
+        Returns:
+            str: The original log message, terminated by a newline.
+        """
+        return self._decode(index, self.param_offset(index))
+
+    def template(self, template_id):
+        return WILDCARD.join(self.templates[template_id])
+
+
+def analyze_encoded_log(encoded, threshold=0.0):
+    """
+    Split the scored messages of an encoded log into anomalies and log patterns.
+
+    Args:
+        encoded (EncodedLog): The scored log.
+        threshold (float): Messages scoring below the threshold are anomalies.
+
+    Returns:
+        tuple: The list of indices of the anomalous messages and the list of
+        PatternRecord for the templates of the other messages, most frequent first.
+    """
+    anomaly_indices = []
+    template_counts = [0] * len(encoded.templates)
+    for i, score in enumerate(encoded.scores):
+        if score < threshold:
+            anomaly_indices.append(i)
+        else:
+            template_counts[encoded.template_ids[i]] += 1
+
+    patterns = [PatternRecord(count, encoded.template(template_id))
+                for template_id, count in enumerate(template_counts) if count]
+    patterns.sort(key=lambda pattern: pattern.count, reverse=True)
+
+    return anomaly_indices, patterns
+
+
+# Columns of an encoded log file, written after its JSON header in this order
+_COLUMNS = ('param_counts', 'template_ids', 'timestamp_bases', 'timestamp_offsets', 'params', 'param_checkpoints',
+            'scores')
+
+
+def save_encoded_log(filename, encoded):
+    """
+    Save an encoded log to a file.
+
+    The file starts with a line of JSON holding the templates, the parameter values and
+    the layout of the columns, followed by the raw bytes of every column. Unlike a
+    pickle, loading the file never runs code from it.
+
+    Args:
+        filename (str): The name of the output file.
+        encoded (EncodedLog): The encoded log.
+    """
+    columns = [getattr(encoded, column) for column in _COLUMNS]
+    header = {
+        'byteorder': sys.byteorder,
+        'templates': [list(parts) for parts in encoded.templates.values],
+        'param_values': encoded.param_values.values,
+        'large_timestamps': sorted(encoded.large_timestamps.items()),
+        'columns': [[name, column.typecode, column.itemsize, len(column)] for name, column in zip(_COLUMNS, columns)],
+    }
+    with open(filename, 'wb') as f:
+        f.write(json.dumps(header).encode('utf-8') + b'\n')
+        for column in columns:
+            f.write(column.tobytes())
+
+
+def load_encoded_log(filename):
+    """
+    Load an encoded log saved by save_encoded_log().
+
+    Args:
+        filename (str): The name of the encoded log file.
+
+    Returns:
+        EncodedLog: The encoded log.
+    """
+    with open(filename, 'rb') as f:
+        header = json.loads(f.readline().decode('utf-8'))
+        encoded = EncodedLog(InternTable(_intern_parts, [_intern_parts(parts) for parts in header['templates']]),
+                             InternTable(values=header['param_values']))
+        encoded.large_timestamps = dict(header['large_timestamps'])
+
+        for name, typecode, itemsize, length in header['columns']:
+            column = array(typecode)
+            if name not in _COLUMNS or column.itemsize != itemsize:
+                raise ValueError(f'{filename} is not a compatible encoded log file')
+            column.frombytes(f.read(itemsize * length))
+            if header['byteorder'] != sys.byteorder:
+                column.byteswap()
+            setattr(encoded, name, column)
+
+    return encoded
@@ -1,6 +1,6 @@
 import os
+import time
 import magic
-import tarfile
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.decomposition import TruncatedSVD
 from sklearn.pipeline import make_pipeline
@@ -10,99 +10,217 @@ from sklearn.ensemble import IsolationForest
 # from Log_Pattern_Generator.log_analyzer.pattern_matcher import create_pipeline, predict_anomalies, train_pipeline
 # from Log_Pattern_Generator.log_analyzer.pattern_writer import write_patterns_to_file
 from anomaly_writer import write_anomalies_to_file
-from pattern_matcher import create_pipeline, predict_anomalies, train_pipeline
+from detectors import DEFAULT_DETECTOR, create_detector
+from encoded_log import EncodedLog, analyze_encoded_log, load_encoded_log, save_encoded_log
+from pattern_matcher import train_pipeline
+from pattern_store import DEFAULT_STORE, store_encoded_log
 from pattern_writer import write_patterns_to_file
+from pipeline_stages import BATCH_SIZE, BackgroundWriter, parse_batches, read_batches, run_stage
 
+# MIME types of compressed log files (.gz, .tgz) that are read besides text files
+COMPRESSED_TYPES = ('application/gzip', 'application/x-gzip')
 
-def process_log_file(log_file, pipeline):
-    if log_file.endswith('.tgz'):
-        # Extract the log file from the .tgz archive
-        with tarfile.open(log_file, 'r:gz') as tar:
-            log_filename = os.path.basename(log_file).replace('.tgz', '')
-            tar.extract(log_filename, path=os.path.dirname(log_file))
-            log_file = os.path.join(os.path.dirname(log_file), log_filename)
+# Suffix of the encoded log files kept in the Log_Patterns directory, see save_encoded_log()
+ENCODED_SUFFIX = '_encoded.bin'
 
-    with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
-        messages = [line for line in f]
+
+def create_family_detector(base_filename, family_detectors=None):
+    # Families without a configured detector, see load_family_detectors(), use the default one
+    name, options = (family_detectors or {}).get(base_filename, (DEFAULT_DETECTOR, {}))
+    return create_detector(name, **options)
+
+
+def base_log_filename(filename):
+    # Remove the .gz, .tar and log extensions and the digits after the dot, e.g. app.log.1.gz -> app
+    log_filename = filename[:-len('.gz')] if filename.endswith('.gz') else filename
+    return os.path.splitext(log_filename)[0].rsplit('.', 1)[0]
+
+
+def encode_log(messages):
+    encoded = EncodedLog()
+    encoded.extend(messages)
+    encoded.compact()
+    return encoded
+
+
+def process_log_file(log_file, pipeline, batch_size=BATCH_SIZE):
+    # Read (and decompress) and parse the log file in a background stage while the lines are collected
+    messages = []
+    for batch in run_stage(parse_batches(read_batches(log_file, batch_size))):
+        messages.extend(batch)
 
     # Check for an empty list of messages
     if not messages:
         print(f'Warning: Empty file {log_file}')
-        return [], [], [], {}
+        return messages, []
+
+    # Detectors that score templates get the encoded log, the others the text as it was read
+    if getattr(pipeline, 'encoded_input', False):
+        messages = encode_log(messages)
 
     # Fit the pipeline on the log messages
     pipeline = train_pipeline(pipeline, messages)
 
     if not pipeline:
-        return messages, [], [], {}
+        return messages, []
 
-    # Predict the anomaly score for each message and return anomalous messages and their indices
-    is_anomaly = predict_anomalies(pipeline, messages)
-    anomalies = [message for i, message in enumerate(messages) if is_anomaly[i]]
-    anomaly_indices = [i for i, is_anomaly in enumerate(is_anomaly) if is_anomaly]
+    # Score all messages in one call, the per-call overhead of the pipeline outweighs any overlap
+    return messages, pipeline.decision_function(messages)
 
-    # Count the frequency of observed log messages that are not anomalies
-    observed_messages = {}
-    for i, message in enumerate(messages):
-        if not is_anomaly[i]:
-            if message not in observed_messages:
-                observed_messages[message] = 1
-            else:
-                observed_messages[message] += 1
 
-    return messages, anomalies, anomaly_indices, observed_messages
+def write_log_results(output_dir, filename, messages, scores, threshold, store_filename, host, run_time):
+    """
+    Encode a scored log file and write its patterns, anomalies and encoded log.
 
+    This runs in the BackgroundWriter, so encoding the log for storage overlaps with
+    scoring the next log file instead of delaying it.
 
-def create_output_dir(log_dir):
-    output_dir = os.path.join(log_dir, 'Log_Patterns')
-    if not os.path.exists(output_dir):
-        os.mkdir(output_dir)
-        print(f'Created {output_dir}')
-    return output_dir
+    Args:
+        output_dir (str): The Log_Patterns directory.
+        filename (str): The name of the log file.
+        messages (sequence): The log messages, or their EncodedLog.
+        scores (sequence): The anomaly score of every message, empty if the log was not scored.
+        threshold (float): Messages scoring below the threshold are anomalies.
+        store_filename (str): The name of the pattern store.
+        host (str): The host that wrote the log file.
+        run_time (int): The time of the scan in milliseconds since the epoch.
+    """
+    encoded = messages if isinstance(messages, EncodedLog) else encode_log(messages)
+    encoded.scores.extend(scores)
 
+    # Get the anomalous messages and the patterns of the observed messages
+    anomaly_indices, patterns = analyze_encoded_log(encoded, threshold)
+    base_filename = base_log_filename(filename)
 
-def scan_logs_for_patterns():
-    # Prompt the user to input the directory where the log files are located
-    log_dir = input('Enter the path to the log file directory: ')
+    # Keep the encoded log so it can be analysed again without the original text, one per log file
+    save_encoded_log(os.path.join(output_dir, filename + ENCODED_SUFFIX), encoded)
 
-    # Create the Log_Patterns directory if it doesn't exist
-    output_dir = create_output_dir(log_dir)
+    # Write patterns to file
+    write_patterns_to_file(os.path.join(output_dir, base_filename + '_patterns.txt'), patterns)
 
-    # Create the pipeline
-    pipeline = create_pipeline()
+    if anomaly_indices:
+        # Write the anomalous messages to the output file
+        write_anomalies_to_file(output_dir, base_filename, [messages[i] for i in anomaly_indices])
 
-    # Loop over all files in the directory
-    for filename in os.listdir(log_dir):
-        filepath = os.path.join(log_dir, filename)
-        if not os.path.isfile(filepath):
-            continue
+    if not encoded.scores:
+        # Training failed, so there are no patterns or anomalies to record
+        print(f'Warning: {filename} was not scored, skipping the pattern store')
+        return
 
-        # Determine the file type using the magic library
-        file_type = magic.from_file(filepath, mime=True)
+    # Add the patterns and anomalies to the pattern store
+    store_encoded_log(store_filename, encoded, anomaly_indices, filename, host, run_time)
 
-        # Handle the file based on its type
-        if not file_type.startswith('text/'):
-            continue
 
-        print(f'Analyzing {filename}...')
+def reanalyze_log_file(encoded_filename, threshold=0.0):
+    """
+    Analyse a saved encoded log file again with a different anomaly threshold.
 
-        # Extract the base filename (i.e. remove the extension and digits after the dot)
-        base_filename = os.path.splitext(filename)[0].rsplit('.', 1)[0]
+    Args:
+        encoded_filename (str): The name of the file written by save_encoded_log().
+        threshold (float): Messages scoring below the threshold are anomalies.
 
-        # Process the log file and get the anomalous messages, their indices, and the observed messages
-        messages, anomalies, anomaly_indices, observed_messages = process_log_file(filepath, pipeline)
+    Returns:
+        tuple: The list of anomalous messages and the list of PatternRecord of the other messages.
+    """
+    encoded = load_encoded_log(encoded_filename)
+    anomaly_indices, patterns = analyze_encoded_log(encoded, threshold)
+    return [encoded.message(i) for i in anomaly_indices], patterns
 
-        if not messages:
-            # Empty file
+
+def reanalyze_logs(log_dir=None, threshold=0.0):
+    # Prompt the user to input the directory where the log files were scanned
+    if log_dir is None:
+        log_dir = input('Enter the path to the log file directory: ')
+
+    output_dir = os.path.join(log_dir, 'Log_Patterns')
+    if not os.path.isdir(output_dir):
+        print(f'No scan results in {log_dir}')
+        return
+
+    # Write the patterns and anomalies of every saved encoded log again with the new threshold.
+    # The pattern store keeps what every scan found and is not changed.
+    for filename in sorted(os.listdir(output_dir)):
+        if not filename.endswith(ENCODED_SUFFIX):
             continue
 
-        # Write patterns to file
-        pattern_filename = os.path.join(output_dir, base_filename + '_patterns.txt')
-        write_patterns_to_file(pattern_filename, observed_messages)
+        print(f'Reanalyzing {filename}...')
+        base_filename = base_log_filename(filename[:-len(ENCODED_SUFFIX)])
+        anomalies, patterns = reanalyze_log_file(os.path.join(output_dir, filename), threshold)
 
+        write_patterns_to_file(os.path.join(output_dir, base_filename + '_patterns.txt'), patterns)
         if anomalies:
-            # Write the anomalous messages to the output file
-            anomaly_output_filename = os.path.join(output_dir, base_filename + '_anomalies.txt')
-            write_anomalies_to_file(anomaly_output_filename, anomalies)
+            write_anomalies_to_file(output_dir, base_filename, anomalies)
+
+    print('Done reanalyzing logs.')
+
+
+def create_output_dir(log_dir):
+    output_dir = os.path.join(log_dir, 'Log_Patterns')
+    if not os.path.exists(output_dir):
+        os.mkdir(output_dir)
+        print(f'Created {output_dir}')
+    return output_dir
+
+
+def scan_logs_for_patterns(log_dir=None, family_detectors=None, threshold=0.0, store_filename=None, host=None):
+    # Prompt the user to input the directory where the log files are located
+    if log_dir is None:
+        log_dir = input('Enter the path to the log file directory: ')
+
+    # Create the Log_Patterns directory if it doesn't exist
+    output_dir = create_output_dir(log_dir)
+
+    # Record the results of this run in the pattern store, by default the one shared by all scans
+    if store_filename is None:
+        store_filename = DEFAULT_STORE
+
+    # Without a host, assume the logs of a host are collected in a directory named after it
+    if host is None:
+        host = os.path.basename(os.path.abspath(log_dir))
+        print(f"Warning: No host given, recording the logs as host '{host}' after their directory")
+    run_time = int(time.time() * 1000)
+
+    # Write the output files in the background while the next log file is processed
+    writer = BackgroundWriter()
+
+    try:
+        # Loop over all files in the directory
+        for filename in os.listdir(log_dir):
+            filepath = os.path.join(log_dir, filename)
+            if not os.path.isfile(filepath):
+                continue
+
+            try:
+                # Determine the file type using the magic library
+                file_type = magic.from_file(filepath, mime=True)
+
+                # Handle the file based on its type, compressed logs are decompressed while reading
+                if not file_type.startswith('text/') and file_type not in COMPRESSED_TYPES:
+                    continue
+
+                print(f'Analyzing {filename}...')
+
+                # Create the detector configured for this log family
+                pipeline = create_family_detector(base_log_filename(filename), family_detectors)
+
+                # Score the log file
+                messages, scores = process_log_file(filepath, pipeline)
+            except Exception as e:
+                # Skip a file that cannot be read, e.g. a corrupt archive, and carry on with the others
+                print(f'Warning: Skipping {filename}: {e}')
+                continue
+
+            if not messages:
+                # Empty file
+                continue
+
+            # Encode and write the results in the background while the next log file is scored
+            writer.submit(write_log_results, output_dir, filename, messages, scores, threshold, store_filename, host,
+                          run_time)
+    except BaseException:
+        # Finish the pending writes, reporting the error that stopped the scan rather than theirs
+        writer.close(raise_errors=False)
+        raise
+    writer.close()
 
     print('Done scanning logs for patterns.')
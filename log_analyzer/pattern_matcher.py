@@ -6,7 +6,7 @@ from sklearn.ensemble import IsolationForest
 import pickle
 
 
-def create_pipeline(log_file=None):
+def create_pipeline(log_file=None, contamination=0.01):
     # Create a TfidfVectorizer and a TruncatedSVD transformer to reduce the dimensionality of the data
     vectorizer = TfidfVectorizer(max_features=8, min_df=1, stop_words='english')
 
@@ -27,7 +27,7 @@ def create_pipeline(log_file=None):
     svd = TruncatedSVD(n_components=n_components)
 
     # Create a pipeline that applies the vectorizer, SVD, and IsolationForest model
-    pipeline = make_pipeline(vectorizer, svd, IsolationForest(contamination=0.01))
+    pipeline = make_pipeline(vectorizer, svd, IsolationForest(contamination=contamination))
 
     return pipeline
 
@@ -0,0 +1,280 @@
+import os
+import sqlite3
+from pathlib import Path
+
+from encoded_log import NO_TIMESTAMP
+
+# Pattern store shared by all scans unless another one is given, so queries cover every host
+DEFAULT_STORE = os.path.join(os.path.expanduser('~'), '.log_analyzer', 'patterns.db')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS templates (
+    id INTEGER PRIMARY KEY,
+    template TEXT NOT NULL UNIQUE
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS templates_fts USING fts5(template, content='templates', content_rowid='id');
+CREATE TABLE IF NOT EXISTS files (
+    host TEXT NOT NULL,
+    file TEXT NOT NULL,
+    last_timestamp INTEGER,
+    lines INTEGER NOT NULL,
+    PRIMARY KEY (host, file)
+);
+CREATE TABLE IF NOT EXISTS patterns (
+    template_id INTEGER NOT NULL REFERENCES templates(id),
+    file TEXT NOT NULL,
+    host TEXT NOT NULL,
+    run_time INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    first_seen INTEGER,
+    last_seen INTEGER
+);
+CREATE TABLE IF NOT EXISTS anomalies (
+    id INTEGER PRIMARY KEY,
+    template_id INTEGER NOT NULL REFERENCES templates(id),
+    file TEXT NOT NULL,
+    host TEXT NOT NULL,
+    run_time INTEGER NOT NULL,
+    timestamp INTEGER,
+    message TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS anomalies_fts USING fts5(message, content='anomalies', content_rowid='id',
+                                                             tokenize='trigram');
+CREATE TRIGGER IF NOT EXISTS anomalies_insert AFTER INSERT ON anomalies BEGIN
+    INSERT INTO anomalies_fts (rowid, message) VALUES (new.id, new.message);
+END;
+CREATE TRIGGER IF NOT EXISTS anomalies_delete AFTER DELETE ON anomalies BEGIN
+    INSERT INTO anomalies_fts (anomalies_fts, rowid, message) VALUES ('delete', old.id, old.message);
+END;
+CREATE INDEX IF NOT EXISTS patterns_file ON patterns(host, file);
+CREATE INDEX IF NOT EXISTS anomalies_file ON anomalies(host, file);
+CREATE INDEX IF NOT EXISTS patterns_template ON patterns(template_id, first_seen);
+CREATE INDEX IF NOT EXISTS patterns_time ON patterns(first_seen);
+CREATE INDEX IF NOT EXISTS anomalies_template ON anomalies(template_id, timestamp);
+CREATE INDEX IF NOT EXISTS anomalies_time ON anomalies(timestamp);
+CREATE INDEX IF NOT EXISTS anomalies_host ON anomalies(host, timestamp);
+'''
+
+
+def open_store(filename, read_only=False):
+    """
+    Open the pattern store, creating its tables if needed.
+
+    Args:
+        filename (str): The name of the SQLite database file.
+        read_only (bool): Open an existing store for queries only.
+
+    Returns:
+        Connection: The connection to the store.
+    """
+    if read_only:
+        return sqlite3.connect(Path(filename).absolute().as_uri() + '?mode=ro', uri=True)
+
+    Path(filename).absolute().parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(filename)
+    connection.executescript(_SCHEMA)
+    return connection
+
+
+def _template_ids(connection, templates):
+    # Look up the id of every template, adding the new ones to the full-text index
+    ids = {}
+    for template in templates:
+        cursor = connection.execute('INSERT OR IGNORE INTO templates (template) VALUES (?)', (template,))
+        if cursor.rowcount:
+            ids[template] = cursor.lastrowid
+            connection.execute('INSERT INTO templates_fts (rowid, template) VALUES (?, ?)', (cursor.lastrowid, template))
+        else:
+            ids[template] = connection.execute('SELECT id FROM templates WHERE template = ?', (template,)).fetchone()[0]
+    return ids
+
+
+def _optional_timestamp(timestamp):
+    return None if timestamp == NO_TIMESTAMP else timestamp
+
+
+def _first_new_message(encoded, last_timestamp, lines):
+    # Messages up to the last timestamp stored for the file were recorded by an earlier scan.
+    # A log without timestamps is taken to only grow, unless it got shorter, i.e. it was rotated.
+    if last_timestamp is None:
+        return lines if len(encoded) >= lines else 0
+    for i in range(len(encoded)):
+        timestamp = encoded.timestamp(i)
+        if timestamp != NO_TIMESTAMP and timestamp > last_timestamp:
+            return i
+    return len(encoded)
+
+
+def insert_encoded_log(connection, encoded, anomaly_indices, file, host, run_time):
+    """
+    Bulk-insert the patterns and anomalies of a scored log into the store.
+
+    Only the messages an earlier scan of the same file on the same host has not
+    recorded are added, so the store keeps the history of a log across rescans,
+    rotation and truncation without counting a message twice. Messages without a
+    score are left out.
+
+    Args:
+        connection (Connection): The connection to the store.
+        encoded (EncodedLog): The scored log.
+        anomaly_indices (list): The indices of the anomalous messages.
+        file (str): The name of the log file.
+        host (str): The host that wrote the log file.
+        run_time (int): The time of the scan in milliseconds since the epoch.
+    """
+    n_scored = len(encoded.scores)
+    with connection:
+        row = connection.execute('SELECT last_timestamp, lines FROM files WHERE host = ? AND file = ?',
+                                 (host, file)).fetchone()
+        start = 0 if row is None else _first_new_message(encoded, *row)
+        anomaly_indices = [i for i in anomaly_indices if i >= start]
+        anomaly_set = set(anomaly_indices)
+
+        # Count the new observed messages of every template and the time range they cover
+        counts = {}
+        last_timestamp = None if row is None else row[0]
+        for i in range(start, n_scored):
+            timestamp = _optional_timestamp(encoded.timestamp(i))
+            if timestamp is not None:
+                last_timestamp = timestamp if last_timestamp is None else max(last_timestamp, timestamp)
+            if i in anomaly_set:
+                continue
+            template_id = encoded.template_ids[i]
+            count, first_seen, last_seen = counts.get(template_id, (0, timestamp, timestamp))
+            if timestamp is not None:
+                first_seen = timestamp if first_seen is None else min(first_seen, timestamp)
+                last_seen = timestamp if last_seen is None else max(last_seen, timestamp)
+            counts[template_id] = (count + 1, first_seen, last_seen)
+
+        # Remember how far the file has been recorded for the next scan
+        connection.execute('INSERT OR REPLACE INTO files (host, file, last_timestamp, lines) VALUES (?, ?, ?, ?)',
+                           (host, file, last_timestamp, n_scored))
+
+        used_template_ids = set(counts) | {encoded.template_ids[i] for i in anomaly_indices}
+        ids = _template_ids(connection, [encoded.template(template_id) for template_id in used_template_ids])
+        store_ids = {template_id: ids[encoded.template(template_id)] for template_id in used_template_ids}
+
+        connection.executemany(
+            'INSERT INTO patterns (template_id, file, host, run_time, count, first_seen, last_seen) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(store_ids[template_id], file, host, run_time, count, first_seen, last_seen)
+             for template_id, (count, first_seen, last_seen) in counts.items()])
+        connection.executemany(
+            'INSERT INTO anomalies (template_id, file, host, run_time, timestamp, message) VALUES (?, ?, ?, ?, ?, ?)',
+            [(store_ids[encoded.template_ids[i]], file, host, run_time,
+              _optional_timestamp(encoded.timestamp(i)), encoded.message(i).rstrip('\n'))
+             for i in anomaly_indices])
+
+
+def store_encoded_log(filename, encoded, anomaly_indices, file, host, run_time):
+    # Open the store for a single insert, so it can be called from a background writer
+    connection = open_store(filename)
+    try:
+        insert_encoded_log(connection, encoded, anomaly_indices, file, host, run_time)
+    finally:
+        connection.close()
+
+
+def _match_expression(text):
+    # Search for the words of the text as a phrase, so FTS5 syntax in the text has no effect
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _filters(text=None, since=None, until=None, host=None, file=None, since_column='timestamp', until_column='timestamp',
+             messages=True):
+    conditions = []
+    params = []
+    if text and messages:
+        # Templates have their variable parts masked, so also search the full anomaly messages
+        conditions.append('(template_id IN (SELECT rowid FROM templates_fts WHERE templates_fts MATCH ?)'
+                          ' OR id IN (SELECT rowid FROM anomalies_fts WHERE anomalies_fts MATCH ?))')
+        params += [_match_expression(text)] * 2
+    elif text:
+        conditions.append('template_id IN (SELECT rowid FROM templates_fts WHERE templates_fts MATCH ?)')
+        params.append(_match_expression(text))
+    if since is not None:
+        conditions.append(f'{since_column} >= ?')
+        params.append(since)
+    if until is not None:
+        conditions.append(f'{until_column} < ?')
+        params.append(until)
+    if host:
+        conditions.append('host = ?')
+        params.append(host)
+    if file:
+        conditions.append('file = ?')
+        params.append(file)
+    where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+    return where, params
+
+
+def search_anomalies(connection, text=None, since=None, until=None, host=None, file=None, limit=20):
+    """
+    Find anomalies by full text and time range, newest first.
+
+    Args:
+        connection (Connection): The connection to the store.
+        text (str): Words the anomaly or its template must contain.
+        since (int): The earliest timestamp in milliseconds since the epoch.
+        until (int): The timestamp in milliseconds since the epoch before which the anomaly occurred.
+        host (str): The host of the anomaly.
+        file (str): The log file of the anomaly.
+        limit (int): The maximum number of anomalies.
+
+    Returns:
+        list: (timestamp, host, file, message) tuples.
+    """
+    where, params = _filters(text, since, until, host, file)
+    return connection.execute(
+        f'SELECT timestamp, host, file, message FROM anomalies{where} ORDER BY timestamp DESC LIMIT ?',
+        params + [limit]).fetchall()
+
+
+def first_seen(connection, text, host=None):
+    """
+    Find when anomalies matching a text first appeared on every host.
+
+    Args:
+        connection (Connection): The connection to the store.
+        text (str): Words the anomaly or its template must contain.
+        host (str): Only look at this host.
+
+    Returns:
+        list: (host, timestamp, file, message) tuples of the first matching anomaly per host, earliest first.
+    """
+    where, params = _filters(text, host=host)
+    return connection.execute(
+        'SELECT host, MIN(timestamp), file, message FROM anomalies'
+        f'{where}{" AND" if where else " WHERE"} timestamp IS NOT NULL GROUP BY host ORDER BY 2',
+        params).fetchall()
+
+
+def top_templates(connection, n=10, anomalies=True, text=None, since=None, until=None, host=None, file=None):
+    """
+    Find the most frequent anomaly or pattern templates.
+
+    Args:
+        connection (Connection): The connection to the store.
+        n (int): The number of templates.
+        anomalies (bool): Count anomalies if True, observed patterns otherwise.
+        text (str): Words the template must contain, or for anomalies the message.
+        since (int): The earliest timestamp in milliseconds since the epoch.
+        until (int): The timestamp in milliseconds since the epoch before which the messages occurred.
+        host (str): Only count messages of this host.
+        file (str): Only count messages of this log file.
+
+    Returns:
+        list: (count, template) tuples, most frequent first.
+    """
+    if anomalies:
+        where, params = _filters(text, since, until, host, file)
+        counts = f'SELECT template_id, COUNT(*) AS count FROM anomalies{where} GROUP BY template_id'
+    else:
+        # Count the patterns whose time range overlaps the requested one
+        where, params = _filters(text, since, until, host, file, since_column='last_seen', until_column='first_seen',
+                                 messages=False)
+        counts = f'SELECT template_id, SUM(count) AS count FROM patterns{where} GROUP BY template_id'
+    return connection.execute(
+        f'SELECT counts.count, templates.template FROM ({counts}) AS counts '
+        'JOIN templates ON templates.id = counts.template_id ORDER BY counts.count DESC LIMIT ?',
+        params + [n]).fetchall()
@@ -7,7 +7,7 @@ def write_patterns_to_file(filename, patterns):
 
     Args:
         filename (str): The name of the output file.
-        patterns (list): A list of dictionaries representing log patterns and their counts.
+        patterns (list): A list of PatternRecord representing log patterns and their counts.
 
     Returns:
         None
@@ -16,6 +16,5 @@ def write_patterns_to_file(filename, patterns):
         filename = ''.join([i for i in filename if not i.isdigit()])
     with open(filename, 'w', encoding='utf-8', errors='ignore') as f:
         for pattern in patterns:
-            # Remove the timestamp from the message before writing to file
-            message = pattern['message'][24:]
-            f.write(f"{pattern['count']}\t{message}\n")
+            # Templates are stored without the timestamp of the message
+            f.write(f"{pattern.count}\t{pattern.message}\n")
@@ -0,0 +1,170 @@
+import gzip
+import io
+import os
+import queue
+import tarfile
+import threading
+
+# Number of log lines handed from one stage to the next in a single batch, large enough
+# that the cost of the hand-over is negligible next to reading and parsing the lines
+BATCH_SIZE = 16384
+
+# Maximum number of batches buffered between two stages before the producer blocks
+QUEUE_SIZE = 8
+
+_DONE = object()
+
+# Seconds a stage waits for room in its queue before checking whether its consumer stopped
+_PUT_TIMEOUT = 0.1
+
+
+class _StageError:
+    def __init__(self, error):
+        self.error = error
+
+
+def run_stage(items, queue_size=QUEUE_SIZE):
+    """
+    Run an iterable in a background thread and hand its items over a bounded queue.
+
+    Args:
+        items (iterable): The stage to run, usually a generator.
+        queue_size (int): The number of items the stage may run ahead of its consumer.
+
+    Returns:
+        generator: Yields the items of the stage in order. An exception raised by the
+        stage is re-raised in the consuming thread.
+    """
+    out_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item):
+        # Wait for room in the queue, giving up once the consumer has stopped
+        while not stop.is_set():
+            try:
+                out_queue.put(item, timeout=_PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def worker():
+        try:
+            for item in items:
+                if not put(item):
+                    break
+        except Exception as e:
+            put(_StageError(e))
+        else:
+            put(_DONE)
+        finally:
+            # Close the stage so it releases its files when the consumer stops early
+            if hasattr(items, 'close'):
+                items.close()
+
+    threading.Thread(target=worker, daemon=True).start()
+
+    try:
+        while True:
+            item = out_queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+def _batched(lines, batch_size):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def read_batches(log_file, batch_size=BATCH_SIZE):
+    """
+    Read a log file in batches of lines, decompressing .tgz, .tar.gz and .gz files on the fly.
+
+    The regular files of an archive are read one after the other, in archive order.
+
+    Args:
+        log_file (str): The path to the log file.
+        batch_size (int): The number of lines per batch.
+
+    Returns:
+        generator: Yields lists of log lines.
+    """
+    if log_file.endswith(('.tgz', '.tar.gz')):
+        # Stream the log files out of the archive instead of extracting them to disk
+        with tarfile.open(log_file, 'r:gz') as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                with io.TextIOWrapper(tar.extractfile(member), encoding='utf-8', errors='ignore') as f:
+                    yield from _batched(f, batch_size)
+    elif log_file.endswith('.gz'):
+        with gzip.open(log_file, 'rt', encoding='utf-8', errors='ignore') as f:
+            yield from _batched(f, batch_size)
+    else:
+        with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
+            yield from _batched(f, batch_size)
+
+
+def parse_batches(batches):
+    """
+    Normalize batches of raw log lines into log messages.
+
+    Every message is terminated by a newline, so the last line of a file can be
+    written out next to the others unchanged. Blank lines are kept, so the index of
+    a message is its line number in the file.
+
+    Args:
+        batches (iterable): Lists of raw log lines.
+
+    Returns:
+        generator: Yields lists of log messages.
+    """
+    for batch in batches:
+        yield [line if line.endswith('\n') else line + '\n' for line in batch]
+
+
+class BackgroundWriter:
+    """
+    Run output writes in a background thread so the next log file can be processed meanwhile.
+
+    Args:
+        queue_size (int): The number of pending writes before submit() blocks.
+    """
+
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._errors = []
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is _DONE:
+                return
+            write, args = job
+            try:
+                write(*args)
+            except Exception as e:
+                self._errors.append(e)
+
+    def submit(self, write, *args):
+        self._queue.put((write, args))
+
+    def close(self, raise_errors=True):
+        # Wait for all pending writes and re-raise the first error, if any
+        self._queue.put(_DONE)
+        self._thread.join()
+        if self._errors and raise_errors:
+            raise self._errors[0]
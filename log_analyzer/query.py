@@ -0,0 +1,70 @@
+import argparse
+import os
+from datetime import datetime, timedelta
+
+from encoded_log import format_timestamp
+from pattern_store import DEFAULT_STORE, first_seen, open_store, search_anomalies, top_templates
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def parse_time(value):
+    # Accept 'YYYY-MM-DD' and 'YYYY-MM-DD HH:MM[:SS]' and return milliseconds since the epoch
+    try:
+        return (datetime.fromisoformat(value) - _EPOCH) // timedelta(milliseconds=1)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time '{value}', expected YYYY-MM-DD[ HH:MM[:SS]]")
+
+
+def _format_optional_timestamp(timestamp):
+    return '-' if timestamp is None else format_timestamp(timestamp)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the patterns and anomalies recorded by the log scanner.')
+    parser.add_argument('--db', default=DEFAULT_STORE, help='pattern store, the --store of run.py (default %(default)s)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    search = commands.add_parser('search', help='anomalies by full text and time range, newest first')
+    search.add_argument('text', nargs='?', help='words the anomaly or its template must contain')
+    search.add_argument('--limit', type=int, default=20, help='maximum number of anomalies')
+
+    first = commands.add_parser('first-seen', help='first occurrence of an anomaly on every host')
+    first.add_argument('text', help='words the anomaly or its template must contain')
+
+    top = commands.add_parser('top', help='most frequent templates')
+    top.add_argument('text', nargs='?', help='words the template, or for anomalies the message, must contain')
+    top.add_argument('-n', type=int, default=10, help='number of templates')
+    top.add_argument('--patterns', action='store_true', help='count observed patterns instead of anomalies')
+
+    for command in (search, first, top):
+        command.add_argument('--host', help='only look at this host')
+    for command in (search, top):
+        command.add_argument('--since', type=parse_time, help='earliest time, YYYY-MM-DD[ HH:MM[:SS]]')
+        command.add_argument('--until', type=parse_time, help='time before which to look, YYYY-MM-DD[ HH:MM[:SS]]')
+        command.add_argument('--file', help='only look at this log file')
+
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.db):
+        parser.error(f'no pattern store at {args.db}')
+
+    connection = open_store(args.db, read_only=True)
+
+    if args.command == 'search':
+        for timestamp, host, file, message in search_anomalies(connection, args.text, args.since, args.until,
+                                                               args.host, args.file, args.limit):
+            print(f'{_format_optional_timestamp(timestamp)}\t{host}\t{file}\t{message}')
+    elif args.command == 'first-seen':
+        for host, timestamp, file, message in first_seen(connection, args.text, args.host):
+            print(f'{_format_optional_timestamp(timestamp)}\t{host}\t{file}\t{message}')
+    else:
+        for count, template in top_templates(connection, args.n, not args.patterns, args.text, args.since,
+                                             args.until, args.host, args.file):
+            print(f'{count}\t{template}')
+
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
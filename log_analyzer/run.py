@@ -5,13 +5,33 @@ import sys
 current_dir = os.path.dirname(os.path.realpath(__file__))
 parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
 sys.path.append(parent_dir)
+# The modules of the package import each other by their plain module names
+sys.path.append(current_dir)
 
+import argparse
 import magic
 from log_analyzer.pattern_matcher import create_pipeline, train_pipeline, predict_anomalies
-from log_analyzer.log_scanner import process_log_file, create_output_dir, scan_logs_for_patterns
+from log_analyzer.detectors import load_family_detectors
+from log_analyzer.log_scanner import process_log_file, create_output_dir, reanalyze_logs, scan_logs_for_patterns
 from log_analyzer.pattern_writer import write_patterns_to_file
 from log_analyzer.anomaly_writer import write_anomalies_to_file
 
 
 if __name__ == '__main__':
-    scan_logs_for_patterns()
+    parser = argparse.ArgumentParser(description='Scan a directory of log files for patterns and anomalies.')
+    parser.add_argument('log_dir', nargs='?', help='directory of the log files (prompted for if omitted)')
+    parser.add_argument('--detectors', help='JSON file with the detector backend per log family')
+    parser.add_argument('--store', help='pattern store to record the scan in (default ~/.log_analyzer/patterns.db)')
+    parser.add_argument('--host', help='host that wrote the logs (guessed from the name of the log directory if omitted)')
+    parser.add_argument('--threshold', type=float, default=0.0,
+                        help='messages scoring below the threshold are anomalies (default 0)')
+    parser.add_argument('--reanalyze', action='store_true',
+                        help='apply the threshold to the encoded logs of an earlier scan instead of scanning again, '
+                             'leaving the pattern store as it is')
+    args = parser.parse_args()
+
+    if args.reanalyze:
+        reanalyze_logs(args.log_dir, args.threshold)
+    else:
+        family_detectors = load_family_detectors(args.detectors) if args.detectors else None
+        scan_logs_for_patterns(args.log_dir, family_detectors, args.threshold, args.store, args.host)
@@ -0,0 +1,60 @@
+import re
+from functools import lru_cache
+
+# Placeholder written in place of the variable parts of a log message
+WILDCARD = '<*>'
+
+# Variable parts of a log message: timestamps, URLs, quoted strings, paths, dotted names
+# (files, packages, hosts), hexadecimal ids, UUIDs and words or numbers containing digits.
+# Inside a word only quotes, paths and digits can start one, which the leading check tells
+# quickly, so the alternatives are only tried at the start of words.
+_VARIABLE_PATTERN = re.compile(
+    r'(?:(?<![\w.])|(?=[\d"\'/]))'
+    r'(\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(?:[,.]\d+)?'
+    r'|\b[a-z][a-z0-9+.-]*://[^\s"\'<>]+'
+    r'|"[^"\n]*"'
+    r"|(?<!\w)'[^'\n]*'(?!\w)"
+    r'|\b[A-Za-z]:\\[^\s"\']*'
+    r'|(?<![\w.])/[\w.-]+(?:/[\w.-]+)+/?'
+    r'|\b0x[0-9a-fA-F]+\b'
+    r'|\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'
+    r'|\b[\w-]+(?:\.[\w-]+)+\b'
+    r'|(?<![\w.-])[\w.-]*\d[\w.-]*)'
+)
+
+
+# Number of distinct messages whose split is remembered, log messages repeat a lot once
+# their timestamp is removed
+_CACHE_SIZE = 8192
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def split_template(message):
+    """
+    Split a log message into the constant parts of its template and its variable parameters.
+
+    Args:
+        message (str): The log message without its trailing newline.
+
+    Returns:
+        tuple: The tuple of constant parts, which is one longer than the tuple of variable
+        parameters, and the tuple of variable parameters. Interleaving the two gives back
+        the message.
+    """
+    pieces = _VARIABLE_PATTERN.split(message)
+    return tuple(pieces[0::2]), tuple(pieces[1::2])
+
+
+def extract_template(message):
+    """
+    Split a log message into its template and its variable parameters.
+
+    Args:
+        message (str): The log message.
+
+    Returns:
+        tuple: The template, with every variable part replaced by WILDCARD, and the
+        list of variable parts in the order they appear in the message.
+    """
+    parts, params = split_template(message.rstrip('\n'))
+    return WILDCARD.join(parts), list(params)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules of the log_analyzer package import each other by their plain module names
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, 'log_analyzer'))
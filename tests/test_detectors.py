@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from detectors import DETECTORS, Detector, IsolationForestDetector, create_detector
+from encoded_log import EncodedLog
+
+
+def _log(n_blank=300, n_words=500):
+    # A frequent template without words next to a frequent template with words
+    return ['\n'] * n_blank + [f'2021-10-16 01:03:{i % 60:02d},000 Service {i} started\n' for i in range(n_words)]
+
+
+@pytest.mark.parametrize('name', DETECTORS)
+def test_every_backend_is_a_detector(name):
+    assert isinstance(create_detector(name), Detector)
+
+
+def test_isolation_forest_only_takes_contamination():
+    detector = create_detector('isolation_forest', contamination=0.05)
+    assert isinstance(detector, IsolationForestDetector)
+    with pytest.raises(TypeError):
+        create_detector('isolation_forest', log_file='app.log')
+
+
+def test_unknown_detector():
+    with pytest.raises(ValueError):
+        create_detector('missing')
+
+
+@pytest.mark.parametrize('name', ['rarity', 'nearest_neighbor'])
+def test_frequent_template_without_words_is_not_an_anomaly(name):
+    messages = _log()
+    scores = create_detector(name, max_ratio=0.01).fit(messages).decision_function(messages)
+    assert (scores >= 0).all()
+
+
+def test_nearest_neighbor_flags_rare_template():
+    messages = _log() + ['2021-10-16 01:04:00,000 Disk failure on controller\n']
+    scores = create_detector('nearest_neighbor', max_ratio=0.01).fit(messages).decision_function(messages)
+    assert scores[-1] < 0
+    assert (scores[:-1] >= 0).all()
+
+
+@pytest.mark.parametrize('name', ['rarity', 'nearest_neighbor'])
+def test_encoded_log_scores_like_text(name):
+    messages = _log() + ['2021-10-16 01:04:00,000 Disk failure on controller\n']
+    encoded = EncodedLog()
+    encoded.extend(messages)
+    text_scores = create_detector(name).fit(messages).decision_function(messages)
+    encoded_scores = create_detector(name).fit(encoded).decision_function(encoded[100:])
+    assert np.allclose(text_scores[100:], encoded_scores)
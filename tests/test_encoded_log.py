@@ -0,0 +1,125 @@
+import json
+
+import pytest
+
+from encoded_log import (NO_TIMESTAMP, EncodedLog, analyze_encoded_log, load_encoded_log, message_template,
+                         parse_timestamp, save_encoded_log)
+
+MESSAGES = [
+    '2021-10-16 01:03:40,045 9456 [DEBUG] - XmlConfiguration is now operational\n',
+    '2021-10-16 01:03:40,149 9456 [INFO ] - Chocolatey v0.11.2\n',
+    '2021-10-16 01:03:40,809 9456 [DEBUG] - Attempting to replace "C:\\ProgramData\\chocolatey\\config"\n',
+    ' with "C:\\ProgramData\\chocolatey\\config.9456.update".\n',
+    '\n',
+    '2021-10-16 01:03:41,002 9456 [INFO ] - Downloading https://example.org/pkg/7zip.19.0.nupkg to /tmp/a/b\n',
+    '2021-10-16 01:03:41,003 9456 [WARN ] - caf\u00e9 \'quoted value\' 0x1F 3fa85f64-5717-4562-b3fc-2c963f66afa6\n',
+    'no timestamp at all\n',
+]
+
+
+def _encode(messages):
+    encoded = EncodedLog()
+    encoded.extend(messages)
+    encoded.compact()
+    return encoded
+
+
+def _letters(i):
+    # Distinct words without digits, so every line gets its own template
+    word = ''
+    while True:
+        i, digit = divmod(i, 26)
+        word += chr(ord('a') + digit)
+        if not i:
+            return word
+
+
+def test_encode_decode_round_trip():
+    encoded = _encode(MESSAGES)
+    assert len(encoded) == len(MESSAGES)
+    assert list(encoded) == MESSAGES
+    assert [encoded.message(i) for i in range(len(MESSAGES))] == MESSAGES
+    assert encoded[-1] == MESSAGES[-1]
+
+
+def test_slices_share_tables():
+    encoded = _encode(MESSAGES * 40)
+    for start, stop in [(0, 0), (3, 70), (64, 128), (65, 300), (100, 1000)]:
+        part = encoded[start:stop]
+        assert list(part) == (MESSAGES * 40)[start:stop]
+        assert part.templates is encoded.templates
+
+
+def test_timestamps():
+    encoded = _encode(MESSAGES)
+    assert encoded.timestamp(0) == parse_timestamp(MESSAGES[0])
+    assert encoded.timestamp(3) == NO_TIMESTAMP
+    assert parse_timestamp('2021-02-30 01:03:40,045 invalid date') == NO_TIMESTAMP
+
+
+def test_templates_mask_variable_parts():
+    assert message_template(MESSAGES[1]) == '<*> [INFO ] - Chocolatey <*>'
+    assert message_template(MESSAGES[5]) == '<*> [INFO ] - Downloading <*> to <*>'
+
+
+def test_analyze_encoded_log():
+    encoded = _encode(MESSAGES[:2] * 3)
+    encoded.scores.extend([1.0, -1.0] * 3)
+    anomaly_indices, patterns = analyze_encoded_log(encoded)
+    assert anomaly_indices == [1, 3, 5]
+    assert [(pattern.count, pattern.message) for pattern in patterns] == [
+        (3, '<*> [DEBUG] - XmlConfiguration is now operational')]
+
+
+def test_save_load_round_trip(tmp_path):
+    encoded = _encode(MESSAGES)
+    encoded.scores.extend(range(len(MESSAGES)))
+    filename = tmp_path / 'app.log_encoded.bin'
+    save_encoded_log(filename, encoded)
+
+    loaded = load_encoded_log(filename)
+    assert list(loaded) == MESSAGES
+    assert list(loaded.scores) == list(encoded.scores)
+    assert analyze_encoded_log(loaded, 3)[0] == [0, 1, 2]
+
+
+def test_save_load_wide_ids(tmp_path):
+    # More than 65536 templates and parameter values need 32-bit ids
+    messages = [f'2021-10-16 01:03:40,045 {_letters(i)} {i}\n' for i in range(66000)]
+    encoded = _encode(messages)
+    assert encoded.template_ids.typecode == 'I'
+    assert encoded.params.typecode == 'I'
+
+    filename = tmp_path / 'wide_encoded.bin'
+    save_encoded_log(filename, encoded)
+    loaded = load_encoded_log(filename)
+    assert loaded.template_ids.typecode == 'I'
+    assert list(loaded) == messages
+
+
+def test_save_load_large_timestamps(tmp_path):
+    # Timestamps more than 24 days from the first one of their block do not fit in 32 bits
+    messages = [
+        '2021-01-01 00:00:00,000 started\n',
+        'continued\n',
+        '2021-03-01 00:00:00,001 restarted\n',
+        '1999-12-31 23:59:59,999 clock reset\n',
+        '2021-01-01 00:00:01,000 back\n',
+    ]
+    encoded = _encode(messages)
+    assert len(encoded.large_timestamps) == 2
+
+    filename = tmp_path / 'large_encoded.bin'
+    save_encoded_log(filename, encoded)
+    loaded = load_encoded_log(filename)
+    assert [loaded.timestamp(i) for i in range(len(messages))] == [parse_timestamp(m) for m in messages]
+    assert list(loaded) == messages
+
+
+def test_load_rejects_unknown_columns(tmp_path):
+    filename = tmp_path / 'bad_encoded.bin'
+    header = {'byteorder': 'little', 'templates': [], 'param_values': [], 'large_timestamps': [],
+              'columns': [['__class__', 'B', 1, 0]]}
+    filename.write_bytes(json.dumps(header).encode('utf-8') + b'\n')
+    with pytest.raises(ValueError):
+        load_encoded_log(filename)
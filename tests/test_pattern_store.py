@@ -0,0 +1,108 @@
+from encoded_log import EncodedLog, parse_timestamp
+from pattern_store import first_seen, insert_encoded_log, open_store, search_anomalies, top_templates
+
+
+def _line(second, text):
+    return f'2021-10-16 01:03:{second:02d},000 1876 {text}\n'
+
+
+def _scored(messages, anomalies=()):
+    # Score the messages containing any of the anomaly texts as anomalies
+    encoded = EncodedLog()
+    encoded.extend(messages)
+    encoded.compact()
+    encoded.scores.extend(-1.0 if any(text in message for text in anomalies) else 1.0 for message in messages)
+    return encoded, [i for i, score in enumerate(encoded.scores) if score < 0]
+
+
+def _insert(connection, messages, anomalies=(), file='chocolatey.log', host='build-01', run_time=0):
+    encoded, anomaly_indices = _scored(messages, anomalies)
+    insert_encoded_log(connection, encoded, anomaly_indices, file, host, run_time)
+
+
+def _counts(connection):
+    patterns = connection.execute('SELECT SUM(count) FROM patterns').fetchone()[0]
+    anomalies = connection.execute('SELECT COUNT(*) FROM anomalies').fetchone()[0]
+    return patterns, anomalies
+
+
+LOG = [_line(0, 'Chocolatey v0.11.2'), _line(1, 'Installing package7'), _line(2, 'Access denied for package1234'),
+       _line(3, 'Installing package8')]
+
+
+def test_open_store_creates_directory(tmp_path):
+    filename = tmp_path / 'shared' / 'patterns.db'
+    open_store(filename).close()
+    assert filename.is_file()
+
+
+def test_rescan_does_not_count_twice(tmp_path):
+    connection = open_store(tmp_path / 'patterns.db')
+    _insert(connection, LOG, ['Access denied'])
+    _insert(connection, LOG, ['Access denied'], run_time=1)
+    assert _counts(connection) == (3, 1)
+
+
+def test_rescan_adds_appended_messages(tmp_path):
+    connection = open_store(tmp_path / 'patterns.db')
+    _insert(connection, LOG, ['Access denied'])
+    _insert(connection, LOG + [_line(4, 'Installing package9'), _line(5, 'Access denied for package99')],
+            ['Access denied'], run_time=1)
+    assert _counts(connection) == (4, 2)
+
+
+def test_rotated_log_keeps_history(tmp_path):
+    connection = open_store(tmp_path / 'patterns.db')
+    _insert(connection, LOG, ['Access denied'])
+    _insert(connection, [_line(30, 'Installing package7'), _line(31, 'Disk full')], ['Disk full'], run_time=1)
+    assert _counts(connection) == (4, 2)
+    assert [row[3] for row in search_anomalies(connection)] == [_line(31, 'Disk full').rstrip('\n'),
+                                                               LOG[2].rstrip('\n')]
+
+
+def test_log_without_timestamps(tmp_path):
+    connection = open_store(tmp_path / 'patterns.db')
+    messages = ['starting\n', 'failed to start\n']
+    _insert(connection, messages, ['failed'])
+    _insert(connection, messages, ['failed'], run_time=1)
+    assert _counts(connection) == (1, 1)
+    _insert(connection, messages + ['stopping\n'], ['failed'], run_time=2)
+    assert _counts(connection) == (2, 1)
+
+
+def test_hosts_are_kept_apart(tmp_path):
+    connection = open_store(tmp_path / 'patterns.db')
+    _insert(connection, LOG, ['Access denied'], host='build-01')
+    _insert(connection, LOG, ['Access denied'], host='build-02')
+    assert _counts(connection) == (6, 2)
+    assert [row[0] for row in first_seen(connection, 'Access denied')] == ['build-01', 'build-02']
+    assert len(search_anomalies(connection, 'denied', host='build-02')) == 1
+
+
+def test_search_finds_masked_values(tmp_path):
+    connection = open_store(tmp_path / 'patterns.db')
+    _insert(connection, LOG, ['Chocolatey', 'Access denied'])
+
+    # Versions and numbers are masked in the templates, but kept in the anomaly messages
+    assert [row[3] for row in search_anomalies(connection, '0.11.2')] == [LOG[0].rstrip('\n')]
+    assert [row[3] for row in search_anomalies(connection, 'package1234')] == [LOG[2].rstrip('\n')]
+    assert [row[3] for row in search_anomalies(connection, 'ckage12')] == [LOG[2].rstrip('\n')]
+    assert search_anomalies(connection, 'package8') == []
+    assert len(search_anomalies(connection, since=parse_timestamp(LOG[1]))) == 1
+
+
+def test_top_templates(tmp_path):
+    connection = open_store(tmp_path / 'patterns.db')
+    _insert(connection, LOG, ['Access denied'])
+    assert top_templates(connection, anomalies=False) == [(2, '<*> Installing <*>'), (1, '<*> Chocolatey <*>')]
+    assert top_templates(connection, anomalies=False, text='package7') == []
+    assert top_templates(connection, anomalies=False, text='installing') == [(2, '<*> Installing <*>')]
+    assert top_templates(connection) == [(1, '<*> Access denied for <*>')]
+
+
+def test_deleted_anomalies_leave_the_index(tmp_path):
+    connection = open_store(tmp_path / 'patterns.db')
+    _insert(connection, LOG, ['Access denied'])
+    with connection:
+        connection.execute('DELETE FROM anomalies')
+    assert search_anomalies(connection, 'package1234') == []